@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for serving the agent with multiple worker processes.
+
+Run from the agent/ directory:
+    poetry run gunicorn sample_agent.demo:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8123')}"
+workers = int(os.getenv("WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Import the app (workflow definition, tools, monkey patch) once in the master and
+# share it copy-on-write with the workers. The checkpointer and compiled graph are
+# created per worker in the FastAPI lifespan, after the fork.
+preload_app = True
@@ -6,17 +6,105 @@ keeps only the explicit regeneration when requested, and allows LangGraph to man
 
 Source: https://gist.github.com/jgabriellima/80b5cdd2b022f5f5cd1e3fcfc018b003
 """
+import asyncio
+import json
 import logging
-from langchain_core.messages import HumanMessage
+import os
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+import orjson
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
-from ag_ui.core import RunAgentInput
+from langgraph.types import Command
+from ag_ui.core import RunAgentInput, EventType, RunStartedEvent, RunFinishedEvent, CustomEvent
+from ag_ui_langgraph.types import LangGraphEventTypes
+from ag_ui_langgraph.utils import agui_messages_to_langchain, get_stream_payload_input, json_safe_stringify
 
 logger = logging.getLogger(__name__)
 
+_CUSTOM_EVENT_TYPE = EventType.CUSTOM
+_INTERRUPT_EVENT_NAME = LangGraphEventTypes.OnInterrupt.value
+
+def _stringify_interrupt_value(value):
+    """
+    Stringify an interrupt payload with orjson, deferring to the library's json.dumps path for what it rejects
+    """
+    if isinstance(value, str):
+        return value
+    try:
+        return orjson.dumps(value, default=json_safe_stringify, option=orjson.OPT_NON_STR_KEYS).decode()
+    except orjson.JSONEncodeError:
+        return json.dumps(value, default=json_safe_stringify)
+
+# Upper bound on graph event streams running at once in this process; further
+# runs wait for a slot instead of piling more work onto the event loop
+_MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "100"))
+_stream_semaphore = asyncio.Semaphore(_MAX_CONCURRENT_STREAMS)
+
+async def _bounded_stream(stream):
+    """
+    Relay a graph event stream while holding a slot of the concurrent-stream limit
+    """
+    async with _stream_semaphore:
+        async for event in stream:
+            yield event
+
 # Store original methods for reference
 _original_prepare_stream = None
 _original_prepare_regenerate_stream = None
 
+@lru_cache(maxsize=256)
+def _cached_schema_keys(agent, graph_id: int, config_key: tuple):
+    """
+    Memoized get_schema_keys, keyed by the compiled graph and its configurable values
+    """
+    return agent.get_schema_keys({"configurable": dict(config_key)})
+
+def _get_schema_keys(agent, config: RunnableConfig):
+    """
+    Resolve schema keys through the cache, falling back to a direct call for unhashable configs
+    """
+    # Schema keys depend on the graph, not the thread, so thread_id stays out of the key
+    configurable = config.get("configurable", {})
+    try:
+        config_key = tuple(sorted((k, v) for k, v in configurable.items() if k != "thread_id"))
+        hash(config_key)
+    except TypeError:
+        return agent.get_schema_keys(config)
+    return _cached_schema_keys(agent, id(agent.graph), config_key)
+
+# Resolved fork points for regeneration, keyed by (thread_id, message_id).
+# Entries never go stale: checkpoint history is append-only and
+# get_checkpoint_before_message returns the first match in time order, so new
+# checkpoints (continue-mode updates, forks) cannot change the result.
+# Callers get their own copy of the values, because the stream handler updates the
+# returned "state" in place with node outputs.
+# Each entry holds the fork's values (message history included), so keep the bound small.
+_CHECKPOINT_CACHE_MAXSIZE = 128
+_checkpoint_cache = OrderedDict()
+
+# The parts of a StateSnapshot the regeneration path uses
+_ForkPoint = namedtuple("_ForkPoint", ["config", "values", "next"])
+
+async def _cached_checkpoint_before_message(agent, thread_id: str, message_id: str):
+    """
+    LRU-cached get_checkpoint_before_message; misses and errors are not cached
+    """
+    key = (thread_id, message_id)
+    fork_point = _checkpoint_cache.get(key)
+    if fork_point is not None:
+        _checkpoint_cache.move_to_end(key)
+        return fork_point._replace(values=dict(fork_point.values))
+    
+    checkpoint = await agent.get_checkpoint_before_message(message_id, thread_id)
+    if checkpoint is None:
+        return None
+    fork_point = _ForkPoint(checkpoint.config, dict(checkpoint.values), checkpoint.next)
+    _checkpoint_cache[key] = fork_point
+    if len(_checkpoint_cache) > _CHECKPOINT_CACHE_MAXSIZE:
+        _checkpoint_cache.popitem(last=False)
+    return fork_point._replace(values=dict(fork_point.values))
+
 def monkey_patch_ag_ui_langgraph():
     """
     Apply monkey patch directly to the ag-ui-langgraph library
@@ -51,43 +139,57 @@ async def patched_prepare_stream(self, input: RunAgentInput, agent_state, config
     forwarded_props = input.forwarded_props or {}
     thread_id = input.thread_id
     
-    state_input["messages"] = agent_state.values.get("messages", [])
-    self.active_run["current_graph_state"] = agent_state.values.copy()
+    # FIX: Only regenerate if explicitly requested
+    is_explicit_regeneration = (
+        forwarded_props and 
+        forwarded_props.get('command', {}).get('resume') is not None
+    )
+    
+    # Reference the checkpointed messages directly; the merge below does not mutate them
+    existing_messages = agent_state.values.get("messages", [])
+    state_input["messages"] = existing_messages
+    
+    if is_explicit_regeneration:
+        # Regeneration needs the full history to locate the user message to replay
+        pending_messages = messages
+    else:
+        # The merge drops messages already in the checkpoint, so only convert the new ones.
+        # The payload's head is always kept: the merge strips index 0 when it is a system
+        # message, so it has to stay in that slot for the result to match.
+        existing_ids = {msg.id for msg in existing_messages}
+        pending_messages = messages[:1] + [msg for msg in messages[1:] if msg.id not in existing_ids]
     
-    # Import the utility function
-    from ag_ui_langgraph.utils import agui_messages_to_langchain
-    langchain_messages = agui_messages_to_langchain(messages)
+    # Not memoized: AG-UI messages are unhashable models, so a cache key would cost a
+    # serialization pass over every message, the same order of work as converting them
+    langchain_messages = agui_messages_to_langchain(pending_messages)
     
     state = self.langgraph_default_merge_state(state_input, langchain_messages, input)
-    self.active_run["current_graph_state"].update(state)
+    # Stream handling tracks state from the prepared response's "state", so the merged
+    # snapshot is only kept for the "continue" and regeneration bookkeeping
+    if self.active_run["mode"] == "continue" or is_explicit_regeneration:
+        current_graph_state = dict(agent_state.values)
+        current_graph_state.update(state)
+        self.active_run["current_graph_state"] = current_graph_state
     config["configurable"]["thread_id"] = thread_id
     
     interrupts = agent_state.tasks[0].interrupts if agent_state.tasks and len(agent_state.tasks) > 0 else []
     has_active_interrupts = len(interrupts) > 0
     resume_input = forwarded_props.get('command', {}).get('resume', None)
     
-    self.active_run["schema_keys"] = self.get_schema_keys(config)
-    
-    # FIX: Only regenerate if explicitly requested
-    is_explicit_regeneration = (
-        forwarded_props and 
-        forwarded_props.get('command', {}).get('resume') is not None
-    )
+    self.active_run["schema_keys"] = _get_schema_keys(self, config)
     
     logger.info(f"PATCH: is_explicit_regeneration = {is_explicit_regeneration}")
     logger.info(f"PATCH: agent_state messages count = {len(agent_state.values.get('messages', []))}")
-    logger.info(f"PATCH: input messages count = {len(langchain_messages)}")
+    logger.info(f"PATCH: input messages count = {len(messages)}, converted = {len(langchain_messages)}")
     
     if is_explicit_regeneration:
         logger.info(f"PATCH: Processing explicit regeneration for thread {thread_id}")
-        from langchain_core.messages import SystemMessage
-        non_system_messages = [msg for msg in langchain_messages if not isinstance(msg, SystemMessage)]
-        if len(agent_state.values.get("messages", [])) > len(non_system_messages):
-            last_user_message = None
-            for i in range(len(langchain_messages) - 1, -1, -1):
-                if isinstance(langchain_messages[i], HumanMessage):
-                    last_user_message = langchain_messages[i]
-                    break
+        non_system_count = sum(1 for msg in langchain_messages if not isinstance(msg, SystemMessage))
+        if len(agent_state.values.get("messages", [])) > non_system_count:
+            last_user_message = next(
+                (msg for msg in reversed(langchain_messages) if isinstance(msg, HumanMessage)),
+                None
+            )
             
             if last_user_message:
                 logger.info(f"PATCH: Starting regenerate_stream for message {last_user_message.id}")
@@ -100,29 +202,22 @@ async def patched_prepare_stream(self, input: RunAgentInput, agent_state, config
     else:
         logger.info(f"PATCH: Using normal flow for thread {thread_id} (no automatic regeneration)")
     
-    events_to_dispatch = []
     if has_active_interrupts and not resume_input:
-        from ag_ui.core import EventType, RunStartedEvent, RunFinishedEvent, CustomEvent
-        from ag_ui_langgraph.types import LangGraphEventTypes
-        from ag_ui_langgraph.utils import json_safe_stringify
-        
-        events_to_dispatch.append(
-            RunStartedEvent(type=EventType.RUN_STARTED, thread_id=thread_id, run_id=self.active_run["id"])
-        )
-        
-        for interrupt in interrupts:
-            events_to_dispatch.append(
-                CustomEvent(
-                    type=EventType.CUSTOM,
-                    name=LangGraphEventTypes.OnInterrupt.value,
-                    value=json_safe_stringify(interrupt.value) if not isinstance(interrupt.value, str) else interrupt.value,
-                    raw_event=interrupt,
-                )
+        run_id = self.active_run["id"]
+        interrupt_events = [
+            CustomEvent(
+                type=_CUSTOM_EVENT_TYPE,
+                name=_INTERRUPT_EVENT_NAME,
+                value=_stringify_interrupt_value(interrupt.value),
+                raw_event=interrupt,
             )
-        
-        events_to_dispatch.append(
-            RunFinishedEvent(type=EventType.RUN_FINISHED, thread_id=thread_id, run_id=self.active_run["id"])
-        )
+            for interrupt in interrupts
+        ]
+        events_to_dispatch = [
+            RunStartedEvent(type=EventType.RUN_STARTED, thread_id=thread_id, run_id=run_id),
+            *interrupt_events,
+            RunFinishedEvent(type=EventType.RUN_FINISHED, thread_id=thread_id, run_id=run_id),
+        ]
         return {
             "stream": None,
             "state": None,
@@ -134,27 +229,23 @@ async def patched_prepare_stream(self, input: RunAgentInput, agent_state, config
         await self.graph.aupdate_state(config, state, as_node=self.active_run.get("node_name"))
     
     if resume_input:
-        from langgraph.types import Command
         stream_input = Command(resume=resume_input)
     else:
-        from ag_ui_langgraph.utils import get_stream_payload_input
         payload_input = get_stream_payload_input(
             mode=self.active_run["mode"],
             state=state,
             schema_keys=self.active_run["schema_keys"],
         )
-        stream_input = {**forwarded_props, **payload_input} if payload_input else None
-    
-    subgraphs_stream_enabled = input.forwarded_props.get('stream_subgraphs') if input.forwarded_props else False
+        stream_input = (forwarded_props | payload_input) if payload_input else None
     
     kwargs = self.get_stream_kwargs(
         input=stream_input,
         config=config,
-        subgraphs=bool(subgraphs_stream_enabled),
+        subgraphs=bool(forwarded_props.get('stream_subgraphs')),
         version="v2",
     )
     
-    stream = self.graph.astream_events(**kwargs)
+    stream = _bounded_stream(self.graph.astream_events(**kwargs))
     
     return {
         "stream": stream,
@@ -172,7 +263,7 @@ async def patched_prepare_regenerate_stream(self, input: RunAgentInput, message_
     logger.info(f"PATCHED prepare_regenerate_stream called for thread {thread_id}, message {message_checkpoint.id}")
     
     try:
-        time_travel_checkpoint = await self.get_checkpoint_before_message(message_checkpoint.id, thread_id)
+        time_travel_checkpoint = await _cached_checkpoint_before_message(self, thread_id, message_checkpoint.id)
         if time_travel_checkpoint is None:
             logger.warning(f"PATCH: No checkpoint found for message {message_checkpoint.id}, falling back to normal flow")
             return None
@@ -193,15 +284,15 @@ async def patched_prepare_regenerate_stream(self, input: RunAgentInput, message_
     )
     
     stream_input = self.langgraph_default_merge_state(time_travel_checkpoint.values, [message_checkpoint], input)
-    subgraphs_stream_enabled = input.forwarded_props.get('stream_subgraphs') if input.forwarded_props else False
+    forwarded_props = input.forwarded_props or {}
     
     kwargs = self.get_stream_kwargs(
         input=stream_input,
         fork=fork,
-        subgraphs=bool(subgraphs_stream_enabled),
+        subgraphs=bool(forwarded_props.get('stream_subgraphs')),
         version="v2",
     )
-    stream = self.graph.astream_events(**kwargs)
+    stream = _bounded_stream(self.graph.astream_events(**kwargs))
     
     return {
         "stream": stream,
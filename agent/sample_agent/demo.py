@@ -4,6 +4,11 @@ through our FastAPI integration. However, you can also host in LangGraph platfor
 """
 
 import os
+import asyncio
+import logging
+import logging.handlers
+import queue
+import sqlite3
 import warnings
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
@@ -12,13 +17,13 @@ load_dotenv() # pylint: disable=wrong-import-position
 # Wycisz warningi Pydantic
 warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse
 import uvicorn
 from copilotkit import LangGraphAGUIAgent
 from sample_agent.agent import workflow
 from ag_ui_langgraph import add_langgraph_fastapi_endpoint
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-import time
 
 # Apply monkey patch to fix ag-ui-langgraph automatic regeneration bug
 import sys
@@ -27,6 +32,26 @@ from monkey_patch_ag_ui_langgraph import apply_monkey_patch
 apply_monkey_patch()
 print("=== Monkey patch applied to ag-ui-langgraph ===", flush=True)
 
+# Route log records through a queue so request handlers never block on stdout;
+# the listener thread owns the actual stream handler. It is started in lifespan
+# so each worker process runs its own listener (threads do not survive fork).
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+logging.basicConfig(handlers=[logging.handlers.QueueHandler(_log_queue)], format="%(message)s")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Per-connection tuning for the checkpointer (AsyncSqliteSaver.setup() already
+# enables WAL): with WAL, synchronous=NORMAL only fsyncs on WAL checkpoints rather
+# than on every commit, temporary tables and indices stay in memory, and reads go
+# through a memory map of the database file instead of read() calls
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
 # Global variable to hold the checkpointer and graph
 checkpointer_cm = None
 graph = None
@@ -36,12 +61,18 @@ async def lifespan(app: FastAPI):
     """Initialize and cleanup the async checkpointer."""
     global checkpointer_cm, graph
     
+    _log_listener.start()
+    
     print("=== Initializing AsyncSqliteSaver ===", flush=True)
     checkpointer_cm = AsyncSqliteSaver.from_conn_string("checkpoints.db")
     async_checkpointer = await checkpointer_cm.__aenter__()
+    for pragma in SQLITE_PRAGMAS:
+        await async_checkpointer.conn.execute(pragma)
     print("=== Checkpointer initialized ===", flush=True)
     
     graph = workflow.compile(checkpointer=async_checkpointer)
+    # Point the registered agent at the compiled graph so requests skip the placeholder
+    agui_agent.graph = graph
     print("=== Graph compiled with persistent checkpointer ===", flush=True)
     
     yield
@@ -50,55 +81,55 @@ async def lifespan(app: FastAPI):
     if checkpointer_cm is not None:
         print("=== Shutting down checkpointer ===", flush=True)
         await checkpointer_cm.__aexit__(None, None, None)
+    
+    _log_listener.stop()
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """Log all incoming requests."""
-    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
     
     # Log request
-    print(f"--> {request.method} {request.url.path}", flush=True)
+    logger.info("--> %s %s", request.method, request.url.path)
     
     # Process request
     response = await call_next(request)
     
     # Log response with more detail for errors
-    duration = time.time() - start_time
+    duration = loop.time() - start_time
     if response.status_code >= 400:
-        print(f"<-- {request.method} {request.url.path} [{response.status_code}] {duration:.2f}s [ERROR]", flush=True)
+        logger.info("<-- %s %s [%d] %.2fs [ERROR]", request.method, request.url.path, response.status_code, duration)
     else:
-        print(f"<-- {request.method} {request.url.path} [{response.status_code}] {duration:.2f}s", flush=True)
+        logger.info("<-- %s %s [%d] %.2fs", request.method, request.url.path, response.status_code, duration)
     
     return response
 
-# Lazy graph wrapper that proxies all attribute access to the actual graph
-class GraphProxy:
-    """Proxy object that defers all attribute/method access to the global graph."""
+# Placeholder graph held by the agent until lifespan swaps in the compiled graph
+class UninitializedGraph:
+    """Stand-in that fails loudly if the agent is used before lifespan startup."""
+    
+    __slots__ = ()
     
     def __getattr__(self, name):
-        """Proxy all attribute access to the compiled graph."""
-        if graph is None:
-            raise RuntimeError("Graph not initialized. This should not happen after lifespan startup.")
-        return getattr(graph, name)
+        """Reject attribute access until the compiled graph is bound."""
+        raise RuntimeError("Graph not initialized. This should not happen after lifespan startup.")
     
     def __call__(self, *args, **kwargs):
-        """Proxy calls to the graph."""
-        if graph is None:
-            raise RuntimeError("Graph not initialized. This should not happen after lifespan startup.")
-        return graph(*args, **kwargs)
+        """Reject calls until the compiled graph is bound."""
+        raise RuntimeError("Graph not initialized. This should not happen after lifespan startup.")
 
-# Create a proxy instance that will forward all access to the graph once it's initialized
-graph_proxy = GraphProxy()
+agui_agent = LangGraphAGUIAgent(
+    name="sample_agent",
+    description="An example agent to use as a starting point for your own agent.",
+    graph=UninitializedGraph()
+)
 
 add_langgraph_fastapi_endpoint(
     app=app,
-    agent=LangGraphAGUIAgent(
-        name="sample_agent",
-        description="An example agent to use as a starting point for your own agent.",
-        graph=graph_proxy
-    ),
+    agent=agui_agent,
     path="/"
 )
 
@@ -108,6 +139,9 @@ from fastapi import HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Any
 
+# LangChain message type -> AG-UI role; anything else is reported as "system"
+_ROLE_MAP = {"human": "user", "ai": "assistant", "system": "system"}
+
 class LoadStateRequest(BaseModel):
     threadId: str
 
@@ -117,6 +151,19 @@ class LoadStateResponse(BaseModel):
     messages: List[Dict[str, Any]]
     state: Dict[str, Any]
 
+def _json_response(response: LoadStateResponse) -> Response:
+    """Encode a response model in one pass with pydantic's serializer."""
+    return Response(response.model_dump_json(), media_type="application/json")
+
+def _empty_load_state_response(thread_id: str) -> Response:
+    """Response for a thread with no readable state."""
+    return _json_response(LoadStateResponse.model_construct(
+        threadId=thread_id,
+        threadExists=False,
+        messages=[],
+        state={}
+    ))
+
 @app.post("/load_state", response_model=LoadStateResponse)
 async def load_state(request: LoadStateRequest):
     """
@@ -125,7 +172,7 @@ async def load_state(request: LoadStateRequest):
     This is a workaround for CopilotKit AG-UI not properly querying
     the agent for state on loadAgentState operations.
     """
-    print(f"[LoadState] Loading state for thread: {request.threadId}", flush=True)
+    logger.info("[LoadState] Loading state for thread: %s", request.threadId)
     
     if graph is None:
         raise HTTPException(status_code=500, detail="Graph not initialized")
@@ -135,38 +182,38 @@ async def load_state(request: LoadStateRequest):
         config = {"configurable": {"thread_id": request.threadId}}
         state = await graph.aget_state(config)
         
-        # Extract messages from state
-        messages = []
-        if state and state.values and "messages" in state.values:
-            for msg in state.values["messages"]:
-                # Convert LangChain message format to simple dict
-                message_dict = {
-                    "id": getattr(msg, "id", f"msg-{len(messages)}"),
-                    "role": "user" if msg.type == "human" else "assistant" if msg.type == "ai" else "system",
-                    "content": msg.content,
-                }
-                messages.append(message_dict)
+        # Convert LangChain messages to simple dicts
+        state_messages = state.values.get("messages", ()) if state and state.values else ()
+        role_for = _ROLE_MAP.get
+        messages = [
+            {
+                "id": getattr(msg, "id", None) or f"msg-{i}",
+                "role": role_for(msg.type, "system"),
+                "content": msg.content,
+            }
+            for i, msg in enumerate(state_messages)
+        ]
         
         thread_exists = len(messages) > 0
         
-        print(f"[LoadState] Found {len(messages)} messages for thread {request.threadId}", flush=True)
-        
-        return LoadStateResponse(
-            threadId=request.threadId,
-            threadExists=thread_exists,
-            messages=messages,
-            state=state.values if state and state.values else {}
-        )
-    
-    except Exception as e:
-        print(f"[LoadState] Error loading state: {e}", flush=True)
+    except (LookupError, ValueError, OSError, sqlite3.Error) as e:
+        logger.warning("[LoadState] Error loading state: %r", e)
         # Return empty state on error (thread doesn't exist)
-        return LoadStateResponse(
-            threadId=request.threadId,
-            threadExists=False,
-            messages=[],
-            state={}
-        )
+        return _empty_load_state_response(request.threadId)
+    
+    logger.info("[LoadState] Found %d messages for thread %s", len(messages), request.threadId)
+    
+    # The response is built server-side from trusted data, so skip validation and
+    # return the encoded body directly instead of letting FastAPI re-validate it.
+    # Encoding stays outside the try: a state that cannot be serialized is a server
+    # error, not an empty thread.
+    response = LoadStateResponse.model_construct(
+        threadId=request.threadId,
+        threadExists=thread_exists,
+        messages=messages,
+        state=state.values if state and state.values else {}
+    )
+    return _json_response(response)
 
 def main():
     """Run the uvicorn server."""
@@ -176,7 +223,10 @@ def main():
         "sample_agent.demo:app",
         host="0.0.0.0",
         port=port,
-        reload=True,
+        reload=os.getenv("RELOAD") == "1",
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools",
+        workers=int(os.getenv("WORKERS", "1")),
         access_log=False,
         log_level="error",
     )